@@ -8,6 +8,24 @@ import yaml
 from spindrift.packager import package
 
 
+# prefer the libyaml bindings when pyyaml was built against them
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+# command line arguments that override a (section, name) in the settings
+SETTINGS_ARGUMENTS = {
+    "package_name": ("package", "name"),
+    "package_type": ("package", "type"),
+    "package_entry": ("package", "entry"),
+    "package_runtime": ("package", "runtime"),
+    "output_path": ("output", "path"),
+    "output_compresslevel": ("output", "compresslevel"),
+}
+
+
 class App(object):
 
     def run(self):
@@ -72,6 +90,14 @@ class App(object):
             help="where to output the resulting zip file",
         )
 
+        parser.add_argument(
+            "--output-compresslevel",
+            help=("deflate level for the resulting zip file, from 0 (no "
+                  "compression) to 9 (smallest). defaults to 1."),
+            type=int,
+            choices=range(10),
+        )
+
         args = parser.parse_args()
 
         settings = {}
@@ -79,39 +105,41 @@ class App(object):
         # figure out how to open our settings file, if we're using one
         settings_path = None
 
-        if os.path.exists("settings.spindrift"):
-            settings_path = "settings.spindrift"
-
         if args.file:
             settings_path = args.file
+        elif os.path.exists("settings.spindrift"):
+            settings_path = "settings.spindrift"
 
         if settings_path is not None:
             with open(settings_path) as fp:
-                settings.update(yaml.safe_load(fp))
-
-        other_arguments = {
-            "package": {
-                "name",
-                "type",
-                "entry",
-                "runtime",
-            },
-            "output": {
-                "path",
-            },
-        }
-
-        for section, names in other_arguments.items():
-            for name in names:
-                arg_name = "{}_{}".format(section, name)
-                arg_value = getattr(args, arg_name)
-
-                if arg_value:
-                    if section not in settings:
-                        settings[section] = {}
-                    settings[section][name] = arg_value
+                settings.update(yaml.load(fp, Loader=SafeLoader))
+
+        arguments = vars(args)
+
+        for arg_name, (section, name) in SETTINGS_ARGUMENTS.items():
+            arg_value = arguments[arg_name]
+
+            if arg_value is not None:
+                if section not in settings:
+                    settings[section] = {}
+                settings[section][name] = arg_value
 
         if args.command == "package":
+
+            # argparse checks --output-compresslevel, but a value from the
+            # settings file isn't checked by anything until zlib gets it,
+            # which is after every dependency has been installed
+            compresslevel = settings["output"].get("compresslevel", 1)
+
+            # yaml gives us a real int for a valid level. a float, a bool or
+            # a quoted string means the file isn't what was intended.
+            if (not isinstance(compresslevel, int)
+                    or isinstance(compresslevel, bool)
+                    or not 0 <= compresslevel <= 9):
+                raise Exception("Invalid output compresslevel {!r}, expected "
+                                "an integer from 0 to 9"
+                                .format(compresslevel))
+
             package(
                 settings["package"]["name"],
                 settings["package"].get("type", "plain"),
@@ -119,6 +147,7 @@ class App(object):
                 settings["package"]["runtime"],
                 settings["output"]["path"],
                 extra_packages=args.extra_package,
+                compresslevel=compresslevel,
             )
         else:
             raise Exception("Implementation Error")
@@ -1,10 +1,14 @@
 # Copyright 2017-2024, Ryan P. Kelly.
 
+import collections
+import concurrent.futures
+import errno
 import fnmatch
 import functools
 import io
 import importlib.metadata
 import glob
+import json
 import logging
 import os.path
 import packaging.tags
@@ -12,17 +16,24 @@ import packaging.utils
 import pathlib
 import re
 import shutil
+import stat
+import struct
 import subprocess
+import sys
 import tempfile
 import zipfile
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 import requests
 
 import spindrift.compat
 
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 
 IGNORED = [
@@ -35,6 +46,124 @@ IGNORED = [
 ]
 
 
+def _split_patterns(patterns):
+    """Split fnmatch patterns into exact names, suffixes ("*suffix"),
+    prefixes ("prefix*"), and a compiled regex for whatever is left (or
+    None)."""
+
+    def is_literal(pattern):
+        return not any(c in pattern for c in "*?[")
+
+    names = set()
+    suffixes = []
+    prefixes = []
+    globs = []
+
+    for pattern in patterns:
+        if is_literal(pattern):
+            names.add(pattern)
+        elif pattern.startswith("*") and is_literal(pattern[1:]):
+            suffixes.append(pattern[1:])
+        elif pattern.endswith("*") and is_literal(pattern[:-1]):
+            prefixes.append(pattern[:-1])
+        else:
+            globs.append(pattern)
+
+    globs_re = None
+    if globs:
+        globs_re = re.compile(
+            "|".join("(?:{})".format(fnmatch.translate(p)) for p in globs)
+        )
+
+    return frozenset(names), tuple(suffixes), tuple(prefixes), globs_re
+
+
+# IGNORED, split up so most names can be checked without a regex
+(
+    _IGNORED_NAMES,
+    _IGNORED_SUFFIXES,
+    _IGNORED_PREFIXES,
+    _IGNORED_RE,
+) = _split_patterns(IGNORED)
+
+
+def _is_ignored(name):
+    """Return true if name matches any of the patterns in IGNORED."""
+    return (
+        name in _IGNORED_NAMES
+        or name.endswith(_IGNORED_SUFFIXES)
+        or name.startswith(_IGNORED_PREFIXES)
+        or (_IGNORED_RE is not None and _IGNORED_RE.match(name) is not None)
+    )
+
+
+# files that are already compressed, so deflating them again is wasted effort
+_STORED_EXTENSIONS = {
+    ".whl",
+    ".egg",
+    ".zip",
+    ".jar",
+    ".gz",
+    ".tgz",
+    ".bz2",
+    ".xz",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".webp",
+    ".woff",
+    ".woff2",
+}
+
+# index.py for flask packages, wrapping the entry point for lambda
+_FLASK_SHIM = """\
+import spindrift.wsgi
+
+app = None
+
+def handler(event, context):
+    global app
+    if app is None:
+{entry}
+    return spindrift.wsgi.handler(app, event, context)
+"""
+
+# what _mangle_package replaces in sqlalchemy-redshift: the version lookup
+# and the dialect's registry name
+_SQLALCHEMY_REDSHIFT_MANGLE_RE = re.compile(
+    rb"(get_distribution\('sqlalchemy-redshift'\).version)|redshift\+psycopg2"
+)
+
+# a line of `readelf -d` output: tag, type, and value
+_ELF_DEPENDENCY_LINE_RE = re.compile(r'^(0x[0-9a-f]+)\s+[(](\w+)[)]\s+(.+$)$')
+
+
+# wheels are found and downloaded concurrently, as most of the work is waiting
+# on pypi. everything that writes into the output directory then happens on the
+# calling thread, in dependency order, as packages may share directories
+# (namespace packages, for instance) and the result shouldn't depend on which
+# download finished first.
+INSTALL_WORKERS = 8
+
+# every request to pypi goes through one session, so connections (and their
+# tls handshakes) are reused across dependencies and worker threads. transient
+# failures are retried with a short backoff rather than failing the build.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(
+        pool_connections=INSTALL_WORKERS,
+        pool_maxsize=INSTALL_WORKERS,
+        max_retries=requests.adapters.Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[500, 502, 503, 504],
+        ),
+    ),
+)
+
+
 def package(
         package,
         type,
@@ -47,7 +176,10 @@ def package(
         prefer_pyc=True,
         boto_handling="default",
         extra_packages=None,
-        dependency_callback=None):
+        dependency_callback=None,
+        compresslevel=1,
+        link_files=False,
+        compression=zipfile.ZIP_DEFLATED):
     """Package up the given package.
 
     :param package: The name of the package to bundle up.
@@ -90,27 +222,54 @@ def package(
     :param dependency_callback: A function taking the arguments (path, package,
         runtime, dependency, dependency_install_method) that allows for
         dependency-specific customization (copying of extra files, etc.).
+        Wheels are downloaded concurrently, but dependencies are installed,
+        and the callback invoked, one at a time in dependency order on the
+        calling thread.
+    :param compresslevel: The deflate level to compress the archive with, from
+        `0` (no compression) to `9` (smallest output). Higher levels are
+        considerably slower for only slightly smaller archives (default: `1`).
+    :param link_files: If `True`, hard link locally installed files into the
+        build directory instead of copying them, falling back to a
+        copy-on-write clone (on filesystems that support them) or a plain copy
+        when that isn't possible (different filesystems, etc.). This avoids
+        copying large dependencies, but files in the build directory may then
+        be the installed files themselves. Any later in-place write to the
+        build directory, by a `dependency_callback` or anything else, changes
+        the installed environment as well, so such files must be replaced
+        rather than modified (default: `False`).
+    :param compression: How to compress the archive, either
+        `zipfile.ZIP_DEFLATED` or `zipfile.ZIP_STORED`. Storing files
+        uncompressed is much faster, which can be handy while iterating on a
+        package, but produces a far larger archive
+        (default: `zipfile.ZIP_DEFLATED`).
 
     """
 
+    # the wheel cache, library paths and editable installs are only looked up
+    # once per call, start with a fresh view of them in case they changed
+    # since the last one
+    load_cached_wheels.cache_clear()
+    _get_ld_library_paths.cache_clear()
+    _get_local_packages.cache_clear()
+
     dependency_packages = [package]
     if extra_packages is not None:
         dependency_packages.extend(extra_packages)
 
     dependencies = []
 
-    # determine what our dependencies are
+    # determine what our dependencies are. every package shares the one list,
+    # so dependencies they have in common are only looked at once.
     for dependency_package in dependency_packages:
-        dependencies_for_package = find_dependencies(
+        find_dependencies(
             type,
             dependency_package,
             renamed_packages,
             boto_handling=boto_handling,
+            dependencies_for_package=dependencies,
         )
 
-        dependencies.extend(dependencies_for_package)
-
-    dependencies = sorted(list(set(dependencies)))
+    dependencies.sort(key=lambda d: d.key)
 
     # create a temporary directory to start creating things in
     with spindrift.compat.TemporaryDirectory() as temp_path:
@@ -128,15 +287,21 @@ def package(
             renamed_packages=renamed_packages,
             prefer_pyc=prefer_pyc,
             dependency_callback=dependency_callback,
+            link_files=link_files,
         )
 
         # ...and create the archive
-        output_archive(temp_path, destination)
+        output_archive(
+            temp_path,
+            destination,
+            compresslevel=compresslevel,
+            compression=compression,
+        )
 
 
-def populate_directory(path, package, type, entry, runtime, dependencies, download=True, cache_path=None, renamed_packages=None, prefer_pyc=True, dependency_callback=None):
+def populate_directory(path, package, type, entry, runtime, dependencies, download=True, cache_path=None, renamed_packages=None, prefer_pyc=True, dependency_callback=None, link_files=False):
 
-    logger.info("[{}] populating output directory".format(package))
+    logger.info("[%s] populating output directory", package)
 
     # install our dependencies
     installed_dependencies = install_dependencies(
@@ -147,10 +312,11 @@ def populate_directory(path, package, type, entry, runtime, dependencies, downlo
         download=download,
         cache_path=cache_path,
         dependency_callback=dependency_callback,
+        link_files=link_files,
     )
 
     # install our project itself
-    install_project(path, package)
+    install_project(path, package, link_files=link_files)
 
     # prune away any unused files
     prune_python_files(path, prefer_pyc=prefer_pyc)
@@ -161,10 +327,10 @@ def populate_directory(path, package, type, entry, runtime, dependencies, downlo
     # write out the requirements.txt file, if applicable
     insert_requirements_txt(path, type, renamed_packages, installed_dependencies)
 
-    logger.info("[{}] done populating output directory".format(package))
+    logger.info("[%s] done populating output directory", package)
 
 
-def output_archive(path, destination):
+def output_archive(path, destination, compresslevel=1, compression=zipfile.ZIP_DEFLATED):
 
     logger.info("outputting archive")
 
@@ -177,19 +343,41 @@ def output_archive(path, destination):
     if is_a_file_object:
 
         # create our zip bundle
-        create_zip_bundle(path, destination)
+        create_zip_bundle(
+            path,
+            destination,
+            compresslevel=compresslevel,
+            compression=compression,
+        )
 
-    # otherwise, create a temporary file and write it
+    # otherwise, build the archive next to the destination and move it into
+    # place once it's complete. a rename doesn't copy any bytes, and nobody
+    # sees a partially written archive.
     else:
 
-        # create a temporary file to zip into
-        with tempfile.NamedTemporaryFile(suffix=".zip") as temp_file:
+        destination = os.fspath(destination)
+        temp_destination = "{}.{}.tmp".format(destination, os.getpid())
+
+        try:
 
             # create our zip bundle
-            create_zip_bundle(path, temp_file.name)
+            create_zip_bundle(
+                path,
+                temp_destination,
+                compresslevel=compresslevel,
+                compression=compression,
+            )
+
+            # keep the permissions of whatever we're replacing
+            if os.path.exists(destination):
+                shutil.copymode(destination, temp_destination)
 
             # output our zip bundle to the given destination
-            output_zip_bundle(temp_file.name, destination)
+            os.replace(temp_destination, destination)
+
+        finally:
+            if os.path.exists(temp_destination):
+                os.unlink(temp_destination)
 
     logger.info("done outputting archive")
 
@@ -198,37 +386,45 @@ def find_dependencies(type, package_name, renamed_packages, boto_handling="defau
     if dependencies_for_package is None:
         dependencies_for_package = []
 
-    package = get_package_from_name(
+    # work out how to rename packages once, not for every package we visit
+    rename = _get_rename_function(renamed_packages)
+
+    package = _get_package_from_name(
         type,
         package_name,
-        renamed_packages,
+        rename,
         boto_handling=boto_handling,
     )
 
-    if package is None:
+    # visit each package in the graph exactly once, no matter how many other
+    # packages depend on it. anything already in dependencies_for_package has
+    # been visited by an earlier call, along with all of its dependencies.
+    processed_dependencies = {d.key for d in dependencies_for_package}
+
+    if package is None or package.key in processed_dependencies:
         return dependencies_for_package
 
     dependencies_for_package.append(package)
-    processed_dependencies = {package}
-    dependencies_to_process = [package]
+
+    processed_dependencies.add(package.key)
+    dependencies_to_process = collections.deque([package])
 
     while dependencies_to_process:
 
-        local_package = dependencies_to_process[0]
-        dependencies_to_process = dependencies_to_process[1:]
+        local_package = dependencies_to_process.popleft()
 
         local_dependencies = _find_dependencies(
             type,
             local_package.key,
-            renamed_packages,
+            rename,
             boto_handling=boto_handling,
         )
 
         for local_dependency in local_dependencies:
-            if local_dependency in processed_dependencies:
+            if local_dependency.key in processed_dependencies:
                 continue
 
-            processed_dependencies.add(local_dependency)
+            processed_dependencies.add(local_dependency.key)
 
             dependencies_to_process.append(local_dependency)
             dependencies_for_package.append(local_dependency)
@@ -236,12 +432,12 @@ def find_dependencies(type, package_name, renamed_packages, boto_handling="defau
     return dependencies_for_package
 
 
-def _find_dependencies(type, package_name, renamed_packages, boto_handling="default"):
+def _find_dependencies(type, package_name, rename, boto_handling="default"):
 
-    package = get_package_from_name(
+    package = _get_package_from_name(
         type,
         package_name,
-        renamed_packages,
+        rename,
         boto_handling=boto_handling,
     )
 
@@ -250,8 +446,32 @@ def _find_dependencies(type, package_name, renamed_packages, boto_handling="defa
 
     ret = [package]
 
-    requires = package.requires()
-    for requirement in requires:
+    for requirement_key in _get_requirement_keys(package.key):
+
+        requirement_package = _get_package_from_name(
+            type,
+            requirement_key,
+            rename,
+            boto_handling=boto_handling,
+        )
+
+        if requirement_package is not None:
+            ret.append(requirement_package)
+
+    # no need to dedupe or sort, find_dependencies skips anything it has
+    # already seen
+    return ret
+
+
+@functools.lru_cache(maxsize=None)
+def _get_requirement_keys(package_key):
+
+    # parsing a distribution's metadata and evaluating its markers gives the
+    # same answer every time, so only do it once per package
+    package = _get_working_set()[package_key]
+
+    ret = []
+    for requirement in package.requires():
 
         # if this requirement is conditional on the environment, skip it if we
         # don't need it
@@ -259,35 +479,38 @@ def _find_dependencies(type, package_name, renamed_packages, boto_handling="defa
             if not requirement.marker.evaluate():
                 continue
 
-        requirement_package = get_package_from_name(
-            type,
-            requirement.key,
-            renamed_packages,
-            boto_handling=boto_handling,
-        )
+        ret.append(requirement.key)
 
-        if requirement_package is not None:
-            ret.append(requirement_package)
+    return tuple(ret)
 
-    return sorted(list(set(ret)))
+
+@functools.lru_cache
+def _get_working_set():
+
+    # importing pkg_resources scans every distribution on sys.path, so only
+    # pay for it once and only when we actually need it
+    import pip._vendor.pkg_resources
+
+    return pip._vendor.pkg_resources.working_set.by_key
 
 
 def get_package_from_name(type, package_name, renamed_packages, boto_handling="default"):
+    return _get_package_from_name(
+        type,
+        package_name,
+        _get_rename_function(renamed_packages),
+        boto_handling=boto_handling,
+    )
 
-    import pip._vendor.pkg_resources
 
-    if renamed_packages is not None:
+def _get_package_from_name(type, package_name, rename, boto_handling="default"):
 
-        if isinstance(renamed_packages, dict):
-            if package_name in renamed_packages:
-                package_name = renamed_packages[package_name]
-        elif callable(renamed_packages):
-            package_name = renamed_packages(package_name)
+    package_name = rename(package_name)
 
     if package_name is None:
         return None
 
-    package = pip._vendor.pkg_resources.working_set.by_key[package_name]
+    package = _get_working_set()[package_name]
 
     # boto is available on lambda, don't always repackage it
     if package.key in ("boto3", "botocore") and boto_handling == "default":
@@ -297,110 +520,153 @@ def get_package_from_name(type, package_name, renamed_packages, boto_handling="d
     return package
 
 
-def install_dependencies(path, package, runtime, dependencies, download=True, cache_path=None, dependency_callback=None):
+def _get_rename_function(renamed_packages):
+    """Turn renamed_packages, a dict, function, or None, into a function."""
+
+    if isinstance(renamed_packages, dict):
+        return lambda package_name: renamed_packages.get(
+            package_name,
+            package_name,
+        )
+    elif callable(renamed_packages):
+        return renamed_packages
+    else:
+        return lambda package_name: package_name
+
+
+def install_dependencies(path, package, runtime, dependencies, download=True, cache_path=None, dependency_callback=None, link_files=False):
 
-    logger.info("[{}] installing dependencies".format(package))
+    logger.info("[%s] installing dependencies", package)
 
     # we will return our dependencies, grouped by the method in which they were
     # installed
     installed_dependencies = {}
 
-    # for each dependency
-    for dependency in dependencies:
+    # don't try to install our own code this way, we'll never need to
+    # download or want to override it
+    dependencies = [d for d in dependencies if d.key != package]
 
-        # don't try to install our own code this way, we'll never need to
-        # download or want to override it
-        if dependency.key == package:
-            continue
+    # index the wheel cache before any workers start. lru_cache doesn't hold
+    # a lock while it computes, so workers that all missed it at once would
+    # each scan the cache and end up with separate indexes.
+    load_cached_wheels(cache_path or _get_fake_cache_path())
 
-        method = install_dependency(
-            path,
-            package,
-            runtime,
-            dependency,
-            download=download,
-            cache_path=cache_path,
-            dependency_callback=dependency_callback,
-        )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=INSTALL_WORKERS) as executor:
 
-        installed_dependencies.setdefault(method, [])
-        installed_dependencies[method].append(dependency)
+        # start finding (and downloading) a wheel for each dependency
+        futures = []
+        for dependency in dependencies:
+            future = executor.submit(
+                _fetch_dependency,
+                dependency,
+                download=download,
+                cache_path=cache_path,
+            )
+
+            futures.append(future)
+
+        # and install them in the order we were given, each as soon as its
+        # wheel is ready
+        try:
+            for dependency, future in zip(dependencies, futures):
+                method = _install_fetched_dependency(
+                    path,
+                    package,
+                    runtime,
+                    dependency,
+                    future.result(),
+                    dependency_callback=dependency_callback,
+                    link_files=link_files,
+                )
 
-    logger.info("[{}] done installing dependencies".format(package))
+                installed_dependencies.setdefault(method, [])
+                installed_dependencies[method].append(dependency)
+
+        except BaseException:
+            # don't wait on downloads that nothing will use
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    logger.info("[%s] done installing dependencies", package)
 
     return installed_dependencies
 
 
-def install_dependency(path, package, runtime, dependency, download=True, cache_path=None, dependency_callback=None):
-    logger.info("[{}] installing {}".format(package, dependency.key))
-    rv = _install_dependency(
+def install_dependency(path, package, runtime, dependency, download=True, cache_path=None, dependency_callback=None, link_files=False):
+    return _install_fetched_dependency(
         path,
         package,
         runtime,
         dependency,
-        download=download,
-        cache_path=cache_path,
+        _fetch_dependency(
+            dependency,
+            download=download,
+            cache_path=cache_path,
+        ),
+        dependency_callback=dependency_callback,
+        link_files=link_files,
     )
 
-    if dependency_callback is not None:
-        dependency_callback(path, package, runtime, dependency, rv)
-
-    return rv
 
+def _fetch_dependency(dependency, download=True, cache_path=None):
+    """Return how dependency will be installed, and the path of the wheel to
+    install it from (None when the local package is to be used)."""
 
-def _install_dependency(path, package, runtime, dependency, download=True, cache_path=None):
-
-    # each of the functions below will return false if they couldn't
-    # perform the requested operation, or true if they did. perform the
-    # attempts in order, and skip the remaining options if we succeed.
+    # each of the functions below will return None if they couldn't find a
+    # wheel. perform the attempts in order, and skip the remaining options if
+    # we succeed.
 
     # see if we've got a manylinux version locally
-    rv = install_manylinux_version(
-        path,
-        dependency,
-        runtime,
-        cache_path=cache_path,
-    )
-    if rv:
-        logger.info(
-            "[{}] installed {} via install_manylinux_version"
-            .format(package, dependency.key)
-        )
-
-        _mangle_package(path, dependency)
-        return "install_manylinux_version"
+    wheel_path = _find_manylinux_version(dependency, cache_path=cache_path)
+    if wheel_path is not None:
+        return "install_manylinux_version", wheel_path
 
-    # maybe try downloading and installing a manylinux version?
+    # maybe try downloading a manylinux version?
     if download:
-        rv = download_and_install_manylinux_version(
-            path,
+        wheel_path = _download_manylinux_version(
             dependency,
-            runtime,
             cache_path=cache_path,
         )
-        if rv:
-            logger.info(
-                "[{}] installed {} via download_and_install_manylinux_version"
-                .format(package, dependency.key)
-            )
-
-            _mangle_package(path, dependency)
-            return "download_and_install_manylinux_version"
+        if wheel_path is not None:
+            return "download_and_install_manylinux_version", wheel_path
 
     # if we get this far, use whatever package we have installed locally
-    rv = install_local_package(path, dependency, package)
-    if rv:
+    return "install_local_package", None
 
-        logger.info(
-            "[{}] installed {} via install_local_package"
-            .format(package, dependency.key)
+
+def _install_fetched_dependency(path, package, runtime, dependency, fetched, dependency_callback=None, link_files=False):
+
+    method, wheel_path = fetched
+
+    logger.info("[%s] installing %s", package, dependency.key)
+
+    if wheel_path is not None:
+        _extract_wheel(wheel_path, path)
+    else:
+        rv = install_local_package(
+            path,
+            dependency,
+            package,
+            link_files=link_files,
         )
 
-        _mangle_package(path, dependency)
-        return "install_local_package"
+        if not rv:
+            raise Exception("Unable to find suitable source for {}=={}"
+                            .format(dependency.key, dependency.version))
+
+    logger.info(
+        "[%s] installed %s via %s",
+        package,
+        dependency.key,
+        method,
+    )
 
-    raise Exception("Unable to find suitable source for {}=={}"
-                    .format(dependency.key, dependency.version))
+    _mangle_package(path, dependency)
+
+    if dependency_callback is not None:
+        dependency_callback(path, package, runtime, dependency, method)
+
+    return method
 
 
 def _mangle_package(path, dependency):
@@ -413,61 +679,67 @@ def _mangle_package(path, dependency):
 
         # overwrite __init__.py to replace pkg_resources.get_distribution call
         # with hardcoded version and fix registry entry
-        sqlalchemy_redshift_init_path = os.path.join(
+        sqlalchemy_redshift_init_path = pathlib.Path(
             path,
             "sqlalchemy_redshift",
             "__init__.py",
         )
 
-        with open(sqlalchemy_redshift_init_path, "r+") as fp:
-            current_init_data = fp.read()
+        # work on the raw bytes, there's no need to decode the whole file
+        current_init_data = sqlalchemy_redshift_init_path.read_bytes()
 
-            version_expr = r"get_distribution\('sqlalchemy-redshift'\).version"
-            mangled_init_data = re.sub(
-                version_expr,
-                '"{}"'.format(dependency.version),
-                current_init_data,
-            )
+        version = '"{}"'.format(dependency.version).encode("utf-8")
 
-            register_expr = r"redshift\+psycopg2"
-            mangled_init_data = re.sub(
-                register_expr,
-                "redshift.psycopg2",
-                mangled_init_data,
-            )
+        def mangle(match):
+            if match.group(1) is not None:
+                return version
+            else:
+                return b"redshift.psycopg2"
+
+        # both replacements in one pass over the file
+        mangled_init_data = _SQLALCHEMY_REDSHIFT_MANGLE_RE.sub(
+            mangle,
+            current_init_data,
+        )
 
-            fp.seek(0)
-            fp.truncate()
-            fp.write(mangled_init_data)
+        # replace the file instead of rewriting it, it may be a hard link to
+        # the locally installed copy
+        sqlalchemy_redshift_init_path.unlink()
+        sqlalchemy_redshift_init_path.write_bytes(mangled_init_data)
 
 
 def install_manylinux_version(path, dependency, runtime, cache_path=None):
 
-    if dependency.key == "cryptography":
+    wheel_path = _find_manylinux_version(dependency, cache_path=cache_path)
+    if wheel_path is None:
         return False
 
+    # unpack the cached wheel into our output
+    _extract_wheel(wheel_path, path)
+
+    # success
+    return True
+
+
+def _find_manylinux_version(dependency, cache_path=None):
+
+    if dependency.key == "cryptography":
+        return None
+
     if dependency.key == "xmlsec":
-        return False
+        return None
 
     if cache_path is None:
         cache_path = _get_fake_cache_path()
 
     # sub out the rest of our work
-    rv = _install_cached_manylinux_version(
-        cache_path,
-        path,
-        dependency,
-        runtime,
-    )
-
-    return rv
+    return _find_cached_manylinux_version(cache_path, dependency)
 
 
 def _get_fake_cache_path():
     cache_path = os.path.join(tempfile.gettempdir(), "spindrift_cache")
 
-    if not os.path.exists(cache_path):
-        os.makedirs(cache_path)
+    os.makedirs(cache_path, exist_ok=True)
 
     return cache_path
 
@@ -502,7 +774,7 @@ def is_wheel_for_dependency(file_name, dependency):
         return False
 
     if _compare_wheel_and_dependency(package_name, version, dependency):
-        if sys_tags & tags:
+        if not sys_tags.isdisjoint(tags):
             return True
 
     return False
@@ -510,33 +782,36 @@ def is_wheel_for_dependency(file_name, dependency):
 
 def download_and_install_manylinux_version(path, dependency, runtime, cache_path=None):
 
-    if dependency.key == "cryptography":
+    wheel_path = _download_manylinux_version(dependency, cache_path=cache_path)
+    if wheel_path is None:
         return False
 
+    # install the retrieved file
+    _extract_wheel(wheel_path, path)
+
+    # success
+    return True
+
+
+def _download_manylinux_version(dependency, cache_path=None):
+
+    if dependency.key == "cryptography":
+        return None
+
     # create our own cache if there is no user specified one
     if cache_path is None:
         cache_path = _get_fake_cache_path()
 
-    # get package info from pypi
-    name = dependency.key
-    res = requests.get("https://pypi.python.org/pypi/{}/json".format(name))
+    # get info on the version we need from pypi
+    data = get_pypi_release(dependency.key, dependency.version, cache_path)
 
-    # if we don't find the package there, bail
-    if res.status_code == 404:
-        return False
-
-    # raise for other errors though
-    res.raise_for_status()
-
-    # see if we can locate our version in the result
-    data = res.json()
-    version = dependency.version
-    if version not in data["releases"]:
-        return False
+    # if we don't find the package or version there, bail
+    if data is None:
+        return None
 
     # and see if we can find the right wheel
     url = None
-    for info in data["releases"][version]:
+    for info in data["urls"]:
 
         if is_wheel_for_dependency(info["filename"], dependency):
             url = info["url"]
@@ -544,27 +819,97 @@ def download_and_install_manylinux_version(path, dependency, runtime, cache_path
 
     # couldn't get the url, bail
     if url is None:
-        return False
+        return None
 
     # figure out what to save this url as
     wheel_name = os.path.basename(url)
     wheel_path = os.path.join(cache_path, wheel_name)
 
-    # download the discovered url into our ghetto cache
-    with open(wheel_path, "wb") as fp:
-        res = requests.get(url, stream=True)
-        res.raise_for_status()
-        for chunk in res.iter_content(chunk_size=1024):
-            fp.write(chunk)
+    # download the discovered url into our ghetto cache. the wheel only gets
+    # its real name once it is complete, so an interrupted download can't
+    # leave a truncated wheel in the cache.
+    partial_wheel_path = "{}.{}.part".format(wheel_path, os.getpid())
 
-    load_cached_wheels.cache_clear()
+    try:
+        with open(partial_wheel_path, "wb") as fp, _SESSION.get(url, stream=True) as res:
+            res.raise_for_status()
+            res.raw.decode_content = True
+            shutil.copyfileobj(res.raw, fp, 1024 * 1024)
 
-    # install the retrieved file
-    with zipfile.ZipFile(wheel_path) as zf:
-        zf.extractall(path)
+        os.replace(partial_wheel_path, wheel_path)
 
-    # success
-    return True
+    finally:
+        if os.path.exists(partial_wheel_path):
+            os.unlink(partial_wheel_path)
+
+    # let the rest of this run know about the new wheel without walking the
+    # whole cache again
+    available_wheels = load_cached_wheels(cache_path)
+    project_wheels = available_wheels.setdefault(
+        packaging.utils.canonicalize_name(dependency.key),
+        {},
+    )
+    project_wheels[wheel_name.lower()] = wheel_path
+
+    return wheel_path
+
+
+def get_pypi_release(name, version, cache_path):
+
+    # ask for just the version we need. the project-wide document lists the
+    # files of every release, which can run to megabytes.
+    url = "https://pypi.org/pypi/{}/{}/json".format(name, version)
+
+    # pypi's answers are kept in the cache along with their etag, so they only
+    # need to be sent again when something changed
+    release_path = os.path.join(
+        cache_path,
+        "_pypi",
+        "{}-{}.json".format(name, version),
+    )
+
+    cached = None
+    try:
+        with open(release_path) as fp:
+            cached = json.load(fp)
+    except (OSError, ValueError):
+        pass
+
+    # anything that isn't a complete entry, say from a hand edit or an older
+    # layout, is no better than not having one
+    if not (isinstance(cached, dict) and "etag" in cached and "data" in cached):
+        cached = None
+
+    headers = {}
+    if cached is not None:
+        headers["If-None-Match"] = cached["etag"]
+
+    res = _SESSION.get(url, headers=headers)
+
+    # nothing changed since we last asked
+    if res.status_code == 304 and cached is not None:
+        return cached["data"]
+
+    # unknown package or version
+    if res.status_code == 404:
+        return None
+
+    # raise for other errors though
+    res.raise_for_status()
+
+    data = res.json()
+
+    etag = res.headers.get("ETag")
+    if etag is not None:
+        os.makedirs(os.path.dirname(release_path), exist_ok=True)
+
+        temp_release_path = "{}.{}.tmp".format(release_path, os.getpid())
+        with open(temp_release_path, "w") as fp:
+            json.dump({"etag": etag, "data": data}, fp)
+
+        os.replace(temp_release_path, release_path)
+
+    return data
 
 
 @functools.lru_cache(maxsize=1000)
@@ -574,55 +919,108 @@ def _get_wheel_info(file_name):
         res = packaging.utils.parse_wheel_filename(file_name)
         name = res[0]
         version = res[1]
-        tags = list(res[3])
+        tags = res[3]
     else:
         name = None
         version = None
-        tags = []
+        tags = frozenset()
 
-    return name, version, set(tags)
+    return name, version, tags
 
 
 @functools.lru_cache
 def _get_sys_tags():
-    return set(list(packaging.tags.sys_tags()))
+    return frozenset(packaging.tags.sys_tags())
 
 
-def _install_cached_manylinux_version(cache_path, path, dependency, runtime):
+def _find_cached_manylinux_version(cache_path, dependency):
 
-    # get every known wheel out of the cache
+    # get the known wheels for this project out of the cache
     available_wheels = load_cached_wheels(cache_path)
+    project_wheels = available_wheels.get(
+        packaging.utils.canonicalize_name(dependency.key),
+        {},
+    )
 
     wheel_name = None
-    for maybe_wheel_name in available_wheels.keys():
+    for maybe_wheel_name in project_wheels.keys():
 
         if is_wheel_for_dependency(maybe_wheel_name, dependency):
             wheel_name = maybe_wheel_name
             break
 
     if wheel_name is None:
-        return False
+        return None
 
-    # unpack the cached wheel into our output
-    wheel_path = available_wheels[wheel_name.lower()]
+    return project_wheels[wheel_name]
+
+
+def _extract_wheel(wheel_path, path):
 
     with zipfile.ZipFile(wheel_path) as zf:
-        zf.extractall(path)
 
-    # success
-    return True
+        # don't bother writing out anything that prune_python_files would just
+        # remove again, or type stubs, which are never imported
+        names = [
+            n for n in zf.namelist()
+            if not _is_ignored(n) and not n.endswith(".pyi")
+        ]
+
+        for name in names:
+
+            # extracting opens the target for writing. if a local package
+            # was linked there first (a namespace package's __init__.py,
+            # say) that would write into the installed copy, so remove
+            # the file first. the path is worked out the way zipfile does.
+            if not name.endswith("/"):
+                target_path = os.path.join(path, *[
+                    c for c in name.split("/")
+                    if c not in ("", ".", "..")
+                ])
+
+                try:
+                    target_stat = os.lstat(target_path)
+                except FileNotFoundError:
+                    pass
+                else:
+                    if not stat.S_ISDIR(target_stat.st_mode):
+                        os.unlink(target_path)
+
+            zf.extract(name, path)
 
 
 @functools.lru_cache
 def load_cached_wheels(path):
+    """Map each project's normalized name to its wheels under path, which are
+    mapped from their lower-cased file name to their location."""
 
     ret = {}
 
-    for root, _, files in os.walk(path):
-        for file in files:
-            if file.endswith(".whl"):
-                ret[file] = os.path.join(root, file)
-                ret[file.lower()] = os.path.join(root, file)
+    # scandir knows what kind of thing each entry is without a stat call,
+    # which adds up on a big cache directory
+    to_scan = [path]
+    while to_scan:
+
+        try:
+            entries = os.scandir(to_scan.pop())
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    to_scan.append(entry.path)
+                elif entry.name.endswith(".whl") and entry.is_file():
+
+                    # group wheels by project so that finding one for a
+                    # dependency doesn't mean checking every wheel we have
+                    try:
+                        project_name, _, _ = _get_wheel_info(entry.name)
+                    except ValueError:
+                        continue
+
+                    project_wheels = ret.setdefault(project_name, {})
+                    project_wheels[entry.name.lower()] = entry.path
 
     return ret
 
@@ -633,12 +1031,9 @@ def find_source_from_metadata(module_name, log_prefix):
         dist = importlib.metadata.distribution(module_name)
     except importlib.metadata.PackageNotFoundError:
         logger.info(
-            (
-                "[{}] unable to locate source for {!r} via importlib metadata"
-            ).format(
-                log_prefix,
-                module_name,
-            )
+            "[%s] unable to locate source for %r via importlib metadata",
+            log_prefix,
+            module_name,
         )
         return None
 
@@ -665,7 +1060,7 @@ def find_source_from_metadata(module_name, log_prefix):
     return module_source
 
 
-def install_local_package(path, dependency, name):
+def install_local_package(path, dependency, name, link_files=False):
 
     if os.path.isfile(dependency.location):
         if dependency.location.endswith(".egg"):
@@ -691,6 +1086,9 @@ def install_local_package(path, dependency, name):
         to_find = []
         shared_objects = []
 
+        # normalized versions of what's in to_copy, for quick lookups
+        to_copy_paths = set()
+
         # XXX: never include these and assume the execution environment includes
         # them
         ignored_shared_objects = [
@@ -744,9 +1142,9 @@ def install_local_package(path, dependency, name):
                         module_path = pathlib.Path(dependency.location)
 
                         for found_path in module_path.rglob(line + ".*.so"):
-                            elf_data = readelf(found_path.as_posix())
-
-                            elf_dependencies = get_dependencies_from_elf_data(elf_data)
+                            elf_dependencies = get_elf_dependencies(
+                                found_path.as_posix(),
+                            )
 
                             for elf_dependency in elf_dependencies:
                                 is_ignored = is_ignored_shared_object(
@@ -773,8 +1171,9 @@ def install_local_package(path, dependency, name):
 
                     # avoid a situation like:
                     # ['websockets', 'websockets/extensions', 'websockets/legacy']
-                    if not _is_path_common_to_any(line, to_copy):
+                    if not _is_path_common_to_any(line, to_copy_paths):
                         to_copy.append(line)
+                        to_copy_paths.add(os.path.normpath(line))
 
                     if dependency.key == "xmlsec" and line == "xmlsec":
                         to_find.append("xmlsec.*.so")
@@ -817,6 +1216,12 @@ def install_local_package(path, dependency, name):
             if os.path.exists(pypdfium2_raw_path):
                 to_copy.append("pypdfium2_raw")
 
+        # either link or copy files into our output
+        if link_files:
+            copy_function = _link_or_copy
+        else:
+            copy_function = shutil.copy2
+
         # copy each found folder into our output
         for folder in to_copy:
 
@@ -831,12 +1236,16 @@ def install_local_package(path, dependency, name):
                     destination = destination + ".py"
 
             if os.path.isfile(source):
-                shutil.copyfile(source, destination)
+                if link_files:
+                    _link_or_copy(source, destination)
+                else:
+                    shutil.copyfile(source, destination)
             elif os.path.isdir(source):
                 shutil.copytree(
                     source,
                     destination,
-                    ignore=shutil.ignore_patterns(*IGNORED),
+                    ignore=_ignore_patterns,
+                    copy_function=copy_function,
                 )
             else:
                 source = find_source_from_metadata(folder, name)
@@ -845,45 +1254,21 @@ def install_local_package(path, dependency, name):
                     shutil.copytree(
                         source,
                         destination,
-                        ignore=shutil.ignore_patterns(*IGNORED),
+                        ignore=_ignore_patterns,
+                        copy_function=copy_function,
                     )
                 else:
-                    logger.warn(
-                        "[{}] exhausted methods to include {!r} in "
+                    logger.warning(
+                        "[%s] exhausted methods to include %r in "
                         "package; this may be not be an issue if the "
-                        "dependency is included some other way"
-                        .format(
-                            name,
-                            folder,
-                        )
+                        "dependency is included some other way",
+                        name,
+                        folder,
                     )
 
         if shared_objects:
 
-            ldconfig_process = subprocess.Popen(
-                [
-                    "ldconfig",
-                    "-v",
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-            )
-
-            ld_library_paths = []
-
-            for line in ldconfig_process.stdout:
-
-                line = line.decode("utf-8")
-
-                if line.startswith("\t"):
-                    continue
-
-                ld_library_path = line.strip()
-                ld_library_path = ld_library_path.strip(":")
-
-                ld_library_paths.append(ld_library_path)
-
-            ldconfig_process.communicate()
+            ld_library_paths = _get_ld_library_paths()
 
             shared_objects = find_shared_objects(
                 shared_objects,
@@ -893,7 +1278,11 @@ def install_local_package(path, dependency, name):
 
             for shared_object in shared_objects:
 
-                logger.info("from {} including shared object {}".format(dependency.key, shared_object))
+                logger.info(
+                    "from %s including shared object %s",
+                    dependency.key,
+                    shared_object,
+                )
 
                 if not ld_library_paths:
                     raise Exception(
@@ -929,13 +1318,120 @@ def install_local_package(path, dependency, name):
     return True
 
 
+def _ignore_patterns(path, names):
+    """shutil.copytree ignore callback, skipping anything matching IGNORED."""
+    return {name for name in names if _is_ignored(name)}
+
+
+# reasons os.link can fail where a clone or copy would still work
+_LINK_FALLBACK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK)
+
+
+def _link_or_copy(source, destination):
+    """shutil.copytree copy function, hard linking files where possible."""
+
+    # a hard link doesn't copy any data, but only works within a single
+    # filesystem (and isn't allowed everywhere), so fall back to a clone and
+    # then to a copy
+    try:
+        os.link(source, destination)
+        return destination
+    except FileExistsError:
+        pass
+    except OSError as e:
+        if e.errno not in _LINK_FALLBACK_ERRNOS:
+            raise
+
+    # something is already there, say from an earlier dependency. it may be a
+    # link into an installed package, so replace it rather than writing
+    # through it.
+    if os.path.lexists(destination):
+        os.unlink(destination)
+
+        try:
+            os.link(source, destination)
+            return destination
+        except OSError as e:
+            if e.errno not in _LINK_FALLBACK_ERRNOS:
+                raise
+
+    if _clone_file(source, destination):
+        shutil.copystat(source, destination)
+    else:
+        shutil.copy2(source, destination)
+
+    return destination
+
+
+# ioctl request number for FICLONE, from linux/fs.h
+_FICLONE = 0x40049409
+
+
+def _clone_file(source, destination):
+    """Copy-on-write clone source to destination, returning success."""
+
+    # btrfs, xfs, and friends can share a file's extents between two files, so
+    # nothing is copied until one of them is modified. this isn't restricted
+    # like hard links can be (fs.protected_hardlinks, for instance).
+    if fcntl is None:
+        return False
+
+    with open(source, "rb") as source_fp, open(destination, "wb") as destination_fp:
+        try:
+            fcntl.ioctl(destination_fp.fileno(), _FICLONE, source_fp.fileno())
+        except OSError:
+            return False
+
+    return True
+
+
+@functools.lru_cache
+def _get_ld_library_paths():
+
+    # every package with shared objects needs these, but they're the same
+    # each time, so only ask ldconfig once
+    ldconfig_process = subprocess.run(
+        [
+            "ldconfig",
+            "-v",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    ld_library_paths = []
+
+    for line in ldconfig_process.stdout.decode("utf-8").splitlines():
+
+        if line.startswith("\t"):
+            continue
+
+        # newer versions of ldconfig say where each path came from, like
+        # "/usr/local/lib: (from /etc/ld.so.conf.d/libc.conf:2)"
+        ld_library_path, _, _ = line.partition(":")
+        ld_library_path = ld_library_path.strip()
+
+        ld_library_paths.append(ld_library_path)
+
+    return tuple(ld_library_paths)
+
+
 def find_shared_objects(shared_objects, ld_library_paths, ignored_dependencies=None):
 
-    ret = []
+    # walk the dependency graph once, looking at each shared object a single
+    # time however many others depend on it (and without looping forever on
+    # libraries that depend on each other)
+    found_shared_objects = set()
+    shared_objects_to_process = collections.deque(shared_objects)
+
+    while shared_objects_to_process:
 
-    for shared_object in shared_objects:
+        shared_object = shared_objects_to_process.popleft()
 
-        ret.append(shared_object)
+        if shared_object in found_shared_objects:
+            continue
+
+        found_shared_objects.add(shared_object)
 
         dependencies = find_shared_object_dependencies(
             shared_object,
@@ -943,15 +1439,9 @@ def find_shared_objects(shared_objects, ld_library_paths, ignored_dependencies=N
             ignored_dependencies=ignored_dependencies,
         )
 
-        ret.extend(
-            find_shared_objects(
-                dependencies,
-                ld_library_paths,
-                ignored_dependencies=ignored_dependencies,
-            )
-        )
+        shared_objects_to_process.extend(dependencies)
 
-    return sorted(list(set(ret)))
+    return sorted(found_shared_objects)
 
 
 def find_shared_object_dependencies(shared_object, ld_library_paths, ignored_dependencies=None):
@@ -963,9 +1453,7 @@ def find_shared_object_dependencies(shared_object, ld_library_paths, ignored_dep
         )
 
         if os.path.exists(maybe_library_path):
-            elf_data = readelf(maybe_library_path)
-
-            dependencies = get_dependencies_from_elf_data(elf_data)
+            dependencies = get_elf_dependencies(maybe_library_path)
 
             if ignored_dependencies is not None:
                 filtered_dependencies = []
@@ -998,9 +1486,195 @@ def is_ignored_shared_object(dependency, ignored_dependencies):
     return False
 
 
+def get_elf_dependencies(library_path):
+
+    # read the libraries straight out of the file if we can, and only ask
+    # readelf about anything our parser doesn't understand
+    mtime = os.stat(library_path).st_mtime_ns
+
+    try:
+        return list(_read_elf_needed(library_path, mtime))
+    except (OSError, ValueError, struct.error):
+        logger.debug(
+            "unable to parse %s, falling back to readelf",
+            library_path,
+        )
+
+    elf_data = readelf(library_path)
+
+    return get_dependencies_from_elf_data(elf_data)
+
+
+# elf constants, from elf.h
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_STRTAB = 5
+
+
+@functools.lru_cache(maxsize=1024)
+def _read_elf_needed(library_path, mtime):
+    """Return the DT_NEEDED entries of the ELF file at library_path."""
+
+    # only the headers, the dynamic section and the names themselves are
+    # read, not the whole library
+    with open(library_path, "rb") as fp:
+
+        ident = _read_elf_range(fp, 0, 16, library_path)
+
+        if ident[:4] != b"\x7fELF":
+            raise ValueError("{} is not an ELF file".format(library_path))
+
+        # 32 or 64 bit, little or big endian
+        if ident[4] == 1:
+            header_format = "HHIIIIIHHHHHH"
+            program_header_format = "IIIIIIII"
+            dynamic_format = "iI"
+        elif ident[4] == 2:
+            header_format = "HHIQQQIHHHHHH"
+            program_header_format = "IIQQQQQQ"
+            dynamic_format = "qQ"
+        else:
+            raise ValueError("unknown ELF class in {}".format(library_path))
+
+        if ident[5] == 1:
+            byte_order = "<"
+        elif ident[5] == 2:
+            byte_order = ">"
+        else:
+            raise ValueError("unknown ELF byte order in {}".format(library_path))
+
+        header_struct = struct.Struct(byte_order + header_format)
+        header = header_struct.unpack(
+            _read_elf_range(fp, 16, header_struct.size, library_path),
+        )
+        program_header_offset = header[4]
+        program_header_size = header[8]
+        program_header_count = header[9]
+
+        program_header_struct = struct.Struct(byte_order + program_header_format)
+        if program_header_count and program_header_size < program_header_struct.size:
+            raise ValueError("bad program header size in {}".format(library_path))
+
+        program_header_data = _read_elf_range(
+            fp,
+            program_header_offset,
+            program_header_count * program_header_size,
+            library_path,
+        )
+
+        # find the dynamic section, and the loadable segments we need to turn
+        # the string table's address into a position in the file
+        loads = []
+        dynamic = None
+        for index in range(program_header_count):
+            program_header = program_header_struct.unpack_from(
+                program_header_data,
+                index * program_header_size,
+            )
+
+            # the field order differs between 32 and 64 bit
+            if ident[4] == 1:
+                p_type, p_offset, p_vaddr, _, p_filesz = program_header[:5]
+            else:
+                p_type, _, p_offset, p_vaddr, _, p_filesz = program_header[:6]
+
+            if p_type == _PT_LOAD:
+                loads.append((p_vaddr, p_offset, p_filesz))
+            elif p_type == _PT_DYNAMIC:
+                dynamic = (p_offset, p_filesz)
+
+        # statically linked
+        if dynamic is None:
+            return ()
+
+        needed_offsets = []
+        string_table_address = None
+
+        dynamic_offset, dynamic_size = dynamic
+        dynamic_data = _read_elf_range(
+            fp,
+            dynamic_offset,
+            dynamic_size,
+            library_path,
+        )
+        for tag, value in struct.iter_unpack(byte_order + dynamic_format, dynamic_data):
+            if tag == _DT_NULL:
+                break
+            elif tag == _DT_NEEDED:
+                needed_offsets.append(value)
+            elif tag == _DT_STRTAB:
+                string_table_address = value
+
+        if not needed_offsets:
+            return ()
+
+        if string_table_address is None:
+            raise ValueError("no string table in {}".format(library_path))
+
+        string_table_offset = None
+        for p_vaddr, p_offset, p_filesz in loads:
+            if p_vaddr <= string_table_address < p_vaddr + p_filesz:
+                string_table_offset = string_table_address - p_vaddr + p_offset
+                break
+
+        if string_table_offset is None:
+            raise ValueError("string table outside of {}".format(library_path))
+
+        ret = []
+        for needed_offset in needed_offsets:
+            ret.append(_read_elf_string(
+                fp,
+                string_table_offset + needed_offset,
+                library_path,
+            ))
+
+    return tuple(ret)
+
+
+def _read_elf_range(fp, offset, size, library_path):
+
+    fp.seek(offset)
+    data = fp.read(size)
+
+    if len(data) != size:
+        raise ValueError("{} is truncated".format(library_path))
+
+    return data
+
+
+def _read_elf_string(fp, offset, library_path):
+
+    # library names are short, so this almost always takes a single read
+    fp.seek(offset)
+
+    data = b""
+    while True:
+        chunk = fp.read(256)
+        if not chunk:
+            raise ValueError("{} is truncated".format(library_path))
+
+        end = chunk.find(b"\0")
+        if end != -1:
+            return (data + chunk[:end]).decode("utf-8")
+
+        data += chunk
+
+
 def readelf(library_path):
 
-    readelf_process = subprocess.Popen(
+    # the same libraries turn up as dependencies of many others, only run
+    # readelf once for each (unless the file changed underneath us)
+    mtime = os.stat(library_path).st_mtime_ns
+
+    return list(_readelf(library_path, mtime))
+
+
+@functools.lru_cache(maxsize=1024)
+def _readelf(library_path, mtime):
+
+    readelf_process = subprocess.run(
         [
             "readelf",
             "-d",
@@ -1010,19 +1684,9 @@ def readelf(library_path):
         stderr=subprocess.DEVNULL,
     )
 
-    elf_data = []
-
-    for line in readelf_process.stdout:
-
-        line = line.decode("utf-8")
+    output = readelf_process.stdout.decode("utf-8")
 
-        elf_line = line.strip()
-
-        elf_data.append(elf_line)
-
-    readelf_process.communicate()
-
-    return elf_data
+    return tuple(line.strip() for line in output.splitlines())
 
 
 def get_dependencies_from_elf_data(elf_data):
@@ -1051,7 +1715,7 @@ def get_dependencies_from_elf_data(elf_data):
 
 
 def parse_elf_dependency_line(line):
-    match = re.search(r'^(0x[0-9a-f]+)\s+[(](\w+)[)]\s+(.+$)$', line)
+    match = _ELF_DEPENDENCY_LINE_RE.search(line)
 
     if not match:
         return None, None, None
@@ -1081,42 +1745,37 @@ def install_local_package_from_egg(path, dependency, egg_path=None):
 
             to_copy.append(line)
 
-        # determine which files to extract
-        all_names = zf.namelist()
+        # determine which files to extract, in one pass over the archive for
+        # all of our folders
+        folder_prefixes = tuple(folder + "/" for folder in to_copy)
+        module_names = {folder + ".py" for folder in to_copy}
 
-        for folder in to_copy:
-            maybe_names_to_copy = []
-            for name in all_names:
-                if name.startswith(folder + "/"):
-                    maybe_names_to_copy.append(name)
-                elif name == folder + ".py":
-                    maybe_names_to_copy.append(name)
-
-            # filter our files to only keep what we want
-            names_to_copy = []
-            for name in maybe_names_to_copy:
-
-                # filter out ignored
-                skip = False
-                for ignored in IGNORED:
-                    if fnmatch.fnmatch(name, ignored):
-                        skip = True
-                        break
+        maybe_names_to_copy = []
+        for name in zf.namelist():
+            if name.startswith(folder_prefixes) or name in module_names:
+                maybe_names_to_copy.append(name)
+
+        # for checking whether a compiled version is present
+        maybe_names_to_copy_set = set(maybe_names_to_copy)
+
+        # filter our files to only keep what we want
+        names_to_copy = []
+        for name in maybe_names_to_copy:
 
-                if skip:
-                    continue
+            # filter out ignored
+            if _is_ignored(name):
+                continue
 
-                # append anything that isn't a .py file
-                if not name.endswith(".py"):
-                    names_to_copy.append(name)
+            # append anything that isn't a .py file
+            if not name.endswith(".py"):
+                names_to_copy.append(name)
 
-                # and make sure we copy the .py file if there is no .pyc file
-                pyc_name = name + "c"
-                if pyc_name not in maybe_names_to_copy:
-                    names_to_copy.append(name)
+            # and make sure we copy the .py file if there is no .pyc file
+            elif name + "c" not in maybe_names_to_copy_set:
+                names_to_copy.append(name)
 
-            # extract all the files to our output location
-            zf.extractall(path, names_to_copy)
+        # extract all the files to our output location
+        zf.extractall(path, names_to_copy)
 
         # hopefully
         return True
@@ -1124,138 +1783,152 @@ def install_local_package_from_egg(path, dependency, egg_path=None):
 
 def _locate_top_level(dependency):
 
-    paths_to_try = []
+    # return the first existing top_level.txt found. candidates are generated
+    # as we go, so we stop looking (and computing names) at the first hit.
+    for path in _top_level_candidates(dependency):
+        top_level_path = os.path.join(path, "top_level.txt")
+        if os.path.isfile(top_level_path):
+            return top_level_path
+
+    # uh oh
+    return None
+
+
+def _top_level_candidates(dependency):
+
+    # pkg_resources already knows where the metadata it read came from, which
+    # is right for nearly everything. the guesses below are the fallback.
+    egg_info = getattr(dependency, "egg_info", None)
+    if egg_info:
+        yield egg_info
+
+    location = dependency.location
 
     # unzipped egg?
-    if dependency.location.endswith(".egg"):
-        paths_to_try.append(os.path.join(dependency.location, "EGG-INFO"))
+    if location.endswith(".egg"):
+        yield os.path.join(location, "EGG-INFO")
+        return
 
     # something else
-    else:
+    key = dependency.key
+    underscored_key = key.replace("-", "_")
 
-        # could be a plain .egg-info folder, or a .egg/EGG-INFO setup
-        egg_info_path = os.path.join(
-            dependency.location,
-            dependency.key + ".egg-info",
-        )
-        paths_to_try.append(egg_info_path)
+    # could be a plain .egg-info folder, or a .egg/EGG-INFO setup
+    yield os.path.join(location, key + ".egg-info")
 
-        # could be a plain .egg-info folder on the egg name
-        egg_info_path = os.path.join(
-            dependency.location,
-            dependency.egg_name() + ".egg-info",
-        )
-        paths_to_try.append(egg_info_path)
+    # could be a plain .egg-info folder on the egg name
+    egg_name = dependency.egg_name()
+    yield os.path.join(location, egg_name + ".egg-info")
 
-        # also try replacing - with _ for a local .egg-info
-        egg_info_path = os.path.join(
-            dependency.location,
-            dependency.key.replace("-", "_") + ".egg-info",
-        )
-        paths_to_try.append(egg_info_path)
+    # also try replacing - with _ for a local .egg-info
+    yield os.path.join(location, underscored_key + ".egg-info")
 
-        egg_name = dependency.egg_name()
-        egg_info_path = os.path.join(
-            dependency.location,
-            egg_name + ".egg",
-            "EGG-INFO",
-        )
-        paths_to_try.append(egg_info_path)
+    yield os.path.join(location, egg_name + ".egg", "EGG-INFO")
 
-        # could also be a .dist-info bundle
-        dist_info_name = "{}-{}.dist-info".format(
-            dependency.key.replace("-", "_"),
-            dependency.version,
-        )
-        dist_info_path = os.path.join(dependency.location, dist_info_name)
-        paths_to_try.append(dist_info_path)
-
-        # and try capitalized name in dist info, too
-        rr = dependency.as_requirement()
-        dist_info_name = "{}-{}.dist-info".format(
-            rr.name.replace("-", "_"),
-            dependency.version,
-        )
-        dist_info_path = os.path.join(dependency.location, dist_info_name)
-        paths_to_try.append(dist_info_path)
+    # could also be a .dist-info bundle
+    dist_info_name = "{}-{}.dist-info".format(
+        underscored_key,
+        dependency.version,
+    )
+    yield os.path.join(location, dist_info_name)
 
-    # loop our paths
-    for path in paths_to_try:
+    # and try capitalized name in dist info, too
+    rr = dependency.as_requirement()
+    dist_info_name = "{}-{}.dist-info".format(
+        rr.name.replace("-", "_"),
+        dependency.version,
+    )
+    yield os.path.join(location, dist_info_name)
 
-        # return the first existing top_level.txt found
-        top_level_path = os.path.join(path, "top_level.txt")
-        if os.path.isfile(top_level_path):
-            return top_level_path
 
-    # uh oh
-    return None
+def _is_path_common_to_any(path, parents):
+    """Return true if path is, or is a subpath of, any path in parents, a set
+    of normalized paths."""
 
+    # look up each of path's ancestors (and path itself) rather than comparing
+    # against every parent. this works on whole components, so foo_bar isn't
+    # mistaken for a child of foo.
+    parts = os.path.normpath(path).split(os.sep)
 
-def _is_path_common_to_any(path, parents):
-    """Return true if path is the subpath of any path in parents."""
+    for index in range(1, len(parts) + 1):
+        if os.sep.join(parts[:index]) in parents:
+            return True
 
-    is_child = False
+    return False
 
-    if len(parents) > 0:
 
-        # use 'join' to force append a trailing '/'
-        current_path_abs = os.path.join(os.path.realpath(path), "")
+def install_project(path, name, link_files=False):
 
-        for parent_path in parents:
-            parent_path_abs = os.path.realpath(parent_path)
+    logger.info("[%s] installing project", name)
 
-            if os.path.commonprefix([current_path_abs, parent_path_abs]) == parent_path_abs:
-                is_child = True
-                break
+    package = _get_working_set()[name]
 
-    return is_child
+    rv = install_local_package(path, package, name, link_files=link_files)
 
+    logger.info("[%s] done installing project", name)
 
-def install_project(path, name):
+    return rv
 
-    logger.info("[{}] installing project".format(name))
 
-    import pip._vendor.pkg_resources
+# removals are independent syscalls that release the gil, so a big prune is
+# spread over a few threads. small ones aren't worth starting a pool for.
+PRUNE_WORKERS = 8
 
-    package = pip._vendor.pkg_resources.working_set.by_key[name]
+_PARALLEL_PRUNE_THRESHOLD = 32
 
-    rv = install_local_package(path, package, name)
 
-    logger.info("[{}] done installing project".format(name))
+def prune_python_files(path, prefer_pyc=True):
 
-    return rv
+    # a single pass decides everything: pycache dirs are erased instead of
+    # descended into, and .py vs .pyc is chosen using each directory's listing
+    pycache_paths = []
+    unlink_paths = []
 
+    directories = [path]
 
-def prune_python_files(path, prefer_pyc=True):
+    while directories:
+        directory = directories.pop()
 
-    # collect all .py files and __pycache__ dirs
-    py_files = []
-    pycache_dirs = []
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            if file.endswith(".py"):
-                py_files.append(os.path.join(root, file))
+        with os.scandir(directory) as it:
+            entries = list(it)
 
-        for folder in dirs:
-            if folder == "__pycache__":
-                pycache_dirs.append(os.path.join(root, folder))
+        names = {entry.name for entry in entries}
 
-    # erase all pycache dirs
-    for pycache_path in pycache_dirs:
-        shutil.rmtree(pycache_path)
+        for entry in entries:
 
-    # determine if they have a corresponding .pyc
-    for py_file in py_files:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name == "__pycache__":
+                    pycache_paths.append(entry.path)
+                else:
+                    directories.append(entry.path)
 
-        pyc_file = py_file + "c"
+                continue
 
-        # if prefer_pyc is true, delete the corresponding .py file. otherwise,
-        # delete the .pyc file
-        if os.path.exists(pyc_file):
-            if prefer_pyc:
-                os.unlink(py_file)
-            else:
-                os.unlink(pyc_file)
+            if not entry.name.endswith(".py"):
+                continue
+
+            pyc_name = entry.name + "c"
+
+            # if prefer_pyc is true, delete the corresponding .py file.
+            # otherwise, delete the .pyc file
+            if pyc_name in names:
+                if prefer_pyc:
+                    unlink_paths.append(entry.path)
+                else:
+                    unlink_paths.append(os.path.join(directory, pyc_name))
+
+    # then do the removals
+    if len(pycache_paths) + len(unlink_paths) < _PARALLEL_PRUNE_THRESHOLD:
+        for pycache_path in pycache_paths:
+            shutil.rmtree(pycache_path)
+        for unlink_path in unlink_paths:
+            os.unlink(unlink_path)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PRUNE_WORKERS) as executor:
+        # consume the results so any error is raised here
+        list(executor.map(shutil.rmtree, pycache_paths))
+        list(executor.map(os.unlink, unlink_paths))
 
 
 def insert_shim(path, type, entry):
@@ -1277,31 +1950,41 @@ def write_plain_shim(path, entry):
 
 def install_flask_resources(path):
 
+    # create a spindrift folder. if spindrift was installed as a dependency
+    # it's already there, complete with the files below.
+    spindrift_output_path = os.path.join(path, "spindrift")
+    try:
+        os.makedirs(spindrift_output_path)
+    except FileExistsError:
+        return
+
+    # add an __init__.py
+    spindrift_init_output_path = os.path.join(
+        spindrift_output_path,
+        "__init__.py",
+    )
+    pathlib.Path(spindrift_init_output_path).touch()
+
+    # copy the wsgi.py file in
+    spindrift_wsgi_output_path = os.path.join(
+        spindrift_output_path,
+        "wsgi.py",
+    )
+    with open(spindrift_wsgi_output_path, "w") as fp:
+        fp.write(_get_wsgi_source())
+
+
+@functools.lru_cache
+def _get_wsgi_source():
+
     # locate spindrift's wsgi file
     import spindrift
     init_path = spindrift.__file__
     lib_path, _ = os.path.split(init_path)
     wsgi_path = os.path.join(lib_path, "wsgi.py")
 
-    # create a spindrift folder
-    spindrift_output_path = os.path.join(path, "spindrift")
-    if not os.path.exists(spindrift_output_path):
-        os.makedirs(spindrift_output_path)
-
-        # add an __init__.py
-        spindrift_init_output_path = os.path.join(
-            spindrift_output_path,
-            "__init__.py",
-        )
-        with open(spindrift_init_output_path, "w"):
-            pass
-
-        # copy the wsgi.py file in
-        spindrift_wsgi_output_path = os.path.join(
-            spindrift_output_path,
-            "wsgi.py",
-        )
-        shutil.copyfile(wsgi_path, spindrift_wsgi_output_path)
+    with open(wsgi_path) as fp:
+        return fp.read()
 
 
 def indent_entry(entry, indent="        "):
@@ -1318,23 +2001,7 @@ def indent_entry(entry, indent="        "):
 def write_flask_shim(path, entry):
     index_path = os.path.join(path, "index.py")
     with open(index_path, "w") as fp:
-        fp.write("import spindrift.wsgi\n")
-        #fp.write("import sys\n")
-        #fp.write("import logging\n")
-        #fp.write("ch = logging.StreamHandler(sys.stdout)\n")
-        #fp.write("ch.setLevel(logging.DEBUG)\n")
-        #fp.write("formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')\n")
-        #fp.write("ch.setFormatter(formatter)\n")
-        #fp.write("logging.getLogger().addHandler(ch)\n")
-        fp.write("\n")
-        fp.write("app = None\n")
-        fp.write("\n")
-        fp.write("def handler(event, context):\n")
-        fp.write("    global app\n")
-        fp.write("    if app is None:\n")
-        fp.write(indent_entry(entry))
-        fp.write("\n")
-        fp.write("    return spindrift.wsgi.handler(app, event, context)\n")
+        fp.write(_FLASK_SHIM.format(entry=indent_entry(entry)))
 
 
 def write_eb_shim(path, entry):
@@ -1344,7 +2011,6 @@ def write_eb_shim(path, entry):
 
 
 def insert_requirements_txt(path, type, renamed_packages, installed_dependencies):
-    import pip._internal.utils.misc
 
     if type != "flask-eb-reqs":
         return
@@ -1352,57 +2018,131 @@ def insert_requirements_txt(path, type, renamed_packages, installed_dependencies
     # determine which packages are local packages and exclude them. we assume
     # that packages installed with setup.py develop (which are editable) are
     # local packages to exclude from the requirements file.
-    local_packages = pip._internal.utils.misc.get_installed_distributions(
-        editables_only=True,
-        include_editables=True,
-    )
+    local_packages = _get_local_packages()
+
+    rename = _get_rename_function(renamed_packages)
+
+    lines = []
+    for _, deps_in_section in installed_dependencies.items():
+
+        for dep in deps_in_section:
+
+            if packaging.utils.canonicalize_name(dep.key) in local_packages:
+                continue
+
+            lines.append("{}=={}\n".format(rename(dep.key), dep.version))
 
     requirements_txt_path = os.path.join(path, "requirements.txt")
     with open(requirements_txt_path, "w") as fp:
+        fp.write("".join(lines))
 
-        for _, deps_in_section in installed_dependencies.items():
 
-            for dep in deps_in_section:
+@functools.lru_cache
+def _get_local_packages():
+    """Return the canonical names of all editable installs."""
 
-                if dep in local_packages:
-                    continue
+    # enumerating installed distributions means touching the metadata of every
+    # one of them, and the answer won't change during a run
+    local_packages = set()
 
-                package_name = dep.key
+    for dist in importlib.metadata.distributions():
 
-                if renamed_packages is not None:
+        # pep 660 style editable installs record it in direct_url.json
+        direct_url = dist.read_text("direct_url.json")
+        if direct_url is None:
+            continue
 
-                    if isinstance(renamed_packages, dict):
-                        if package_name in renamed_packages:
-                            package_name = renamed_packages[package_name]
-                    elif callable(renamed_packages):
-                        package_name = renamed_packages(package_name)
+        try:
+            dir_info = json.loads(direct_url).get("dir_info", {})
+        except ValueError:
+            continue
 
-                fp.write("{}=={}\n".format(package_name, dep.version))
+        if dir_info.get("editable"):
+            name = dist.metadata["Name"]
+            if name:
+                local_packages.add(packaging.utils.canonicalize_name(name))
 
+    # setup.py develop leaves a <name>.egg-link behind instead
+    for sys_path in sys.path:
+        try:
+            it = os.scandir(sys_path or ".")
+        except OSError:
+            continue
 
-def create_zip_bundle(path, zip_path):
+        with it:
+            for entry in it:
+                if entry.name.endswith(".egg-link"):
+                    name = entry.name[:-len(".egg-link")]
+                    local_packages.add(packaging.utils.canonicalize_name(name))
 
-    with zipfile.ZipFile(zip_path, "a", zipfile.ZIP_DEFLATED) as zf:
-        for root, _, files in os.walk(path):
-            for file in files:
+    return frozenset(local_packages)
 
-                # determine where in the zip file our real file ends up
-                real_file_path = os.path.join(root, file)
-                truncated = real_file_path[len(path):]
-                truncated = truncated.lstrip(os.sep)
 
-                # create a zip info object...
-                zi = zipfile.ZipInfo(truncated)
+def create_zip_bundle(path, zip_path, compresslevel=1, compression=zipfile.ZIP_DEFLATED):
+
+    # a path gets a brand new archive, written through a large buffer. file
+    # objects are appended to, as they always have been.
+    if isinstance(zip_path, (str, bytes, os.PathLike)):
+        with open(zip_path, "wb", buffering=1024 * 1024) as fp:
+            _write_zip_bundle(path, fp, "w", compresslevel, compression)
+    else:
+        _write_zip_bundle(path, zip_path, "a", compresslevel, compression)
+
+
+def _write_zip_bundle(path, fp, mode, compresslevel, compression):
+
+    if compression not in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+        raise Exception("Unsupported compression {!r}".format(compression))
+
+    # deflate at level 1 by default. it is several times faster than zlib's
+    # default of 6 and the archive only comes out slightly larger.
+    with zipfile.ZipFile(fp, mode, compression, compresslevel=compresslevel) as zf:
+
+        for entry, archive_name in _walk_files(path):
+
+            # create a zip info object...
+            zi = zipfile.ZipInfo(archive_name)
+
+            # ...and only deflate what will actually get smaller
+            extension = os.path.splitext(entry.name)[1].lower()
+            if compression == zipfile.ZIP_STORED:
+                zi.compress_type = zipfile.ZIP_STORED
+            elif extension in _STORED_EXTENSIONS:
+                zi.compress_type = zipfile.ZIP_STORED
+            else:
                 zi.compress_type = zipfile.ZIP_DEFLATED
+                zi._compresslevel = compresslevel
 
-                # ensure our files are readable
-                # XXX: seems like a hack...
-                zi.external_attr = 0o755 << 16
+            # ensure our files are readable
+            # XXX: seems like a hack...
+            zi.external_attr = 0o755 << 16
 
-                # ...and put it in our zip file
-                with open(real_file_path, "rb") as fp:
-                    zf.writestr(zi, fp.read(), zipfile.ZIP_DEFLATED)
+            # ...and stream it into our zip file. the size is needed up front
+            # to decide whether the entry needs zip64.
+            with open(entry.path, "rb") as source_fp:
+                zi.file_size = os.fstat(source_fp.fileno()).st_size
+                with zf.open(zi, "w") as zfp:
+                    shutil.copyfileobj(source_fp, zfp, 1024 * 1024)
 
 
-def output_zip_bundle(zip_path, destination):
-    shutil.copyfile(zip_path, destination)
+def _walk_files(path, archive_prefix=""):
+    """Yield a DirEntry for every file under path, in os.walk order, along
+    with its name in the archive."""
+
+    directories = []
+
+    with os.scandir(path) as it:
+        for entry in it:
+
+            # like os.walk, don't descend into symlinked directories
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    directories.append(entry)
+            else:
+                yield entry, archive_prefix + entry.name
+
+    for directory in directories:
+        yield from _walk_files(
+            directory.path,
+            archive_prefix + directory.name + "/",
+        )
@@ -4,9 +4,10 @@
 Lambda-Flask WSGI shim. Only used by Lambda.
 """
 
+import base64
 import io
 import sys
-import urllib
+from urllib.parse import unquote_plus, urlencode
 
 from werkzeug.wrappers import Response
 from werkzeug.wsgi import ClosingIterator
@@ -28,17 +29,21 @@ def handler(app, event, context):
     # create the object we're going to send back to api gateway
     ret = {}
 
-    # populate the body
-    ret["body"] = response.get_data(as_text=True) # XXX: binary support...
-    ret["isBase64Encoded"] = False
+    # populate the body. anything that isn't valid utf-8 is sent back base64
+    # encoded so api gateway can return it as binary.
+    body = response.get_data()
+    try:
+        ret["body"] = body.decode("utf-8")
+        ret["isBase64Encoded"] = False
+    except UnicodeDecodeError:
+        ret["body"] = base64.b64encode(body).decode("ascii")
+        ret["isBase64Encoded"] = True
 
     # add in a status code
     ret["statusCode"] = response.status_code
 
     # add in headers
-    ret["headers"] = {}
-    for header, value in response.headers:
-        ret["headers"][header] = value
+    ret["headers"] = dict(response.headers.items())
 
     # boom.
     return ret
@@ -56,26 +61,24 @@ def create_wsgi_environ(event):
 
     # decode the path being request
     path = event["path"]
-    path = urllib.parse.unquote_plus(path)
+    path = unquote_plus(path)
 
     # format the query string
     query = event["queryStringParameters"]
     query_string = ""
     if query:
-        query_string = urllib.parse.urlencode(query)
+        query_string = urlencode(query)
 
     # server name should be configurable?
     server_name = "spindrift"
 
-    # fixup headers
+    # header names are case-insensitive, so look them up through a
+    # lowercased copy rather than rewriting the event's own dict
     headers = event["headers"] or {}
-    for header in list(headers.keys()):
-        canonical = header.title()
-        if header != canonical:
-            headers[canonical] = headers.pop(header)
+    lowercase_headers = {k.lower(): v for k, v in headers.items()}
 
     # XXX: do we trust this?
-    server_port = headers.get("X-Forwarded-Port", "80")
+    server_port = lowercase_headers.get("x-forwarded-port", "80")
 
     # determine the remote address
     remote_addr = "127.0.0.1"
@@ -86,7 +89,7 @@ def create_wsgi_environ(event):
                 remote_addr = event["requestContext"]["identity"]["sourceIp"]
 
     if remote_addr == "127.0.0.1":
-        x_forwarded_for = headers.get("X-Forwarded-For", "")
+        x_forwarded_for = lowercase_headers.get("x-forwarded-for", "")
         remotes = x_forwarded_for.split(",")
         remotes = [r.strip() for r in remotes]
 
@@ -94,11 +97,14 @@ def create_wsgi_environ(event):
             remote_addr = remotes[0]
 
     # XXX: do we trust this? isn't it always https?
-    wsgi_url_scheme = headers.get("X-Forwarded-Proto", "http"),
-
-    # retrieve the body and encode it
-    body = event["body"]
-    if isinstance(body, str):
+    wsgi_url_scheme = lowercase_headers.get("x-forwarded-proto", "http")
+
+    # retrieve the body and decode or encode it to bytes. api gateway sends
+    # binary payloads as base64 text and says so with isBase64Encoded.
+    body = event["body"] or b""
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
         body = body.encode("utf-8")
 
     # setup initial environ dict
@@ -121,21 +127,17 @@ def create_wsgi_environ(event):
     }
 
     # get content-type from headers
-    content_type = headers.get("Content-Type")
+    content_type = lowercase_headers.get("content-type")
     if content_type is not None:
         environ["CONTENT_TYPE"] = content_type
 
-    # determine content-length from the body of request
-    environ["CONTENT_LENGTH"] = 0
-    if body:
-        environ["CONTENT_LENGTH"] = len(body)
+    # determine content-length from the body of request. pep 3333 wants
+    # this as a string.
+    environ["CONTENT_LENGTH"] = str(len(body))
 
     # apply all HTTP_* headers into the environ
-    for header, value in headers.items():
-        key_name = header.replace("-", "_")
-        key_name = key_name.upper()
-        key_name = "HTTP_" + key_name
-        environ[key_name] = value
+    for header, value in lowercase_headers.items():
+        environ["HTTP_" + header.replace("-", "_").upper()] = value
 
     # send back our completed environ
     return environ
@@ -0,0 +1,116 @@
+# Copyright 2017-2024, Ryan P. Kelly.
+
+import glob
+import os.path
+import shutil
+import struct
+import sys
+import sysconfig
+
+import pytest
+
+import spindrift.packager
+
+
+def _find_libraries():
+
+    candidates = [sys.executable]
+    candidates.extend(glob.glob("/lib/x86_64-linux-gnu/libc.so.*"))
+    candidates.extend(glob.glob("/usr/lib/x86_64-linux-gnu/libc.so.*"))
+    candidates.extend(glob.glob(os.path.join(
+        sysconfig.get_paths()["platstdlib"],
+        "lib-dynload",
+        "*.so",
+    ))[:5])
+
+    libraries = []
+    for candidate in candidates:
+        candidate = os.path.realpath(candidate)
+        with open(candidate, "rb") as fp:
+            if fp.read(4) == b"\x7fELF" and candidate not in libraries:
+                libraries.append(candidate)
+
+    return libraries
+
+
+def _readelf_needed(library_path):
+    elf_data = spindrift.packager.readelf(library_path)
+    return spindrift.packager.get_dependencies_from_elf_data(elf_data)
+
+
+def _build_elf32(byte_order):
+
+    # a minimal shared object: one loadable segment covering the whole file,
+    # a string table, and a dynamic section naming two libraries
+    string_table = b"\0libfoo.so.1\0libbar.so\0"
+
+    string_table_offset = 52 + 2 * 32
+    dynamic_offset = string_table_offset + len(string_table)
+    dynamic = b"".join([
+        struct.pack(byte_order + "iI", 1, 1),
+        struct.pack(byte_order + "iI", 1, 13),
+        struct.pack(byte_order + "iI", 5, string_table_offset),
+        struct.pack(byte_order + "iI", 0, 0),
+    ])
+    size = dynamic_offset + len(dynamic)
+
+    ident = b"\x7fELF" + bytes([1, 1 if byte_order == "<" else 2, 1]) + bytes(9)
+    header = struct.pack(
+        byte_order + "HHIIIIIHHHHHH",
+        3, 3, 1, 0, 52, 0, 0, 52, 32, 2, 0, 0, 0,
+    )
+    program_headers = b"".join([
+        struct.pack(byte_order + "IIIIIIII", 1, 0, 0, 0, size, size, 5, 0x1000),
+        struct.pack(
+            byte_order + "IIIIIIII",
+            2, dynamic_offset, dynamic_offset, dynamic_offset,
+            len(dynamic), len(dynamic), 6, 4,
+        ),
+    ])
+
+    return ident + header + program_headers + string_table + dynamic
+
+
+needs_readelf = pytest.mark.skipif(
+    shutil.which("readelf") is None,
+    reason="readelf is not installed",
+)
+
+
+@needs_readelf
+@pytest.mark.parametrize("library_path", _find_libraries())
+def test_read_elf_needed_matches_readelf(library_path):
+    needed = spindrift.packager._read_elf_needed(library_path, None)
+    assert list(needed) == _readelf_needed(library_path)
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_read_elf_needed_32_bit(tmp_path, byte_order):
+    library_path = tmp_path / "libtest.so"
+    library_path.write_bytes(_build_elf32(byte_order))
+
+    needed = spindrift.packager._read_elf_needed(str(library_path), None)
+    assert needed == ("libfoo.so.1", "libbar.so")
+
+
+@needs_readelf
+def test_truncated_elf_falls_back_to_readelf(tmp_path, monkeypatch):
+    library_path = tmp_path / "libtest.so"
+    library_path.write_bytes(_build_elf32("<")[:100])
+
+    with pytest.raises(ValueError):
+        spindrift.packager._read_elf_needed(str(library_path), None)
+
+    calls = []
+    readelf = spindrift.packager.readelf
+
+    def record_readelf(path):
+        calls.append(path)
+        return readelf(path)
+
+    monkeypatch.setattr(spindrift.packager, "readelf", record_readelf)
+
+    dependencies = spindrift.packager.get_elf_dependencies(str(library_path))
+
+    assert calls == [str(library_path)]
+    assert dependencies == _readelf_needed(str(library_path))
@@ -0,0 +1,37 @@
+# Copyright 2017-2024, Ryan P. Kelly.
+
+import os.path
+
+import pytest
+
+import spindrift.packager
+
+
+def _parents(*paths):
+    return {os.path.normpath(p) for p in paths}
+
+
+@pytest.mark.parametrize("path, parents", [
+    ("websockets", ["websockets"]),
+    ("websockets/extensions", ["websockets"]),
+    ("websockets/legacy/", ["websockets"]),
+    ("a/b/c", ["a/b"]),
+    ("./foo/bar", ["foo"]),
+])
+def test_path_is_common(path, parents):
+    assert spindrift.packager._is_path_common_to_any(path, _parents(*parents))
+
+
+@pytest.mark.parametrize("path, parents", [
+    # a string prefix, but a different package
+    ("foo_bar", ["foo"]),
+    ("foobar", ["foo"]),
+    ("foo.libs", ["foo"]),
+    # a sibling, not a child
+    ("a/bc", ["a/b"]),
+    # the parent of something we're copying isn't covered by it
+    ("a", ["a/b"]),
+    ("foo", []),
+])
+def test_path_is_not_common(path, parents):
+    assert not spindrift.packager._is_path_common_to_any(path, _parents(*parents))
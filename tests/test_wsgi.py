@@ -0,0 +1,86 @@
+# Copyright 2017-2024, Ryan P. Kelly.
+
+import base64
+
+import spindrift.wsgi
+
+
+def _make_event(body=None, is_base64_encoded=False, headers=None):
+    return {
+        "httpMethod": "POST",
+        "path": "/",
+        "queryStringParameters": None,
+        "headers": headers,
+        "body": body,
+        "isBase64Encoded": is_base64_encoded,
+    }
+
+
+def _echo_app(environ, start_response):
+
+    # send back exactly what was received, along with its declared length
+    body = environ["wsgi.input"].read()
+    start_response("200 OK", [
+        ("Content-Type", "application/octet-stream"),
+        ("X-Content-Length", environ["CONTENT_LENGTH"]),
+    ])
+    return [body]
+
+
+def _make_app(body, content_type):
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", content_type)])
+        return [body]
+
+    return app
+
+
+def test_base64_request_body_is_decoded():
+    body = b"\x89PNG\r\n\x1a\n\x00\xff"
+    event = _make_event(
+        body=base64.b64encode(body).decode("ascii"),
+        is_base64_encoded=True,
+    )
+
+    response = spindrift.wsgi.handler(_echo_app, event, None)
+
+    assert response["headers"]["X-Content-Length"] == str(len(body))
+    assert base64.b64decode(response["body"]) == body
+
+
+def test_text_request_body_is_utf8_encoded():
+    event = _make_event(body="héllo")
+
+    environ = spindrift.wsgi.create_wsgi_environ(event)
+
+    assert environ["wsgi.input"].read() == "héllo".encode("utf-8")
+    assert environ["CONTENT_LENGTH"] == "6"
+
+
+def test_missing_request_body_is_empty():
+    environ = spindrift.wsgi.create_wsgi_environ(_make_event())
+
+    assert environ["wsgi.input"].read() == b""
+    assert environ["CONTENT_LENGTH"] == "0"
+
+
+def test_binary_response_is_base64_encoded():
+    body = b"\x89PNG\r\n\x1a\n\x00\xff\xfe"
+    app = _make_app(body, "image/png")
+
+    response = spindrift.wsgi.handler(app, _make_event(), None)
+
+    assert response["isBase64Encoded"] is True
+    assert base64.b64decode(response["body"]) == body
+    assert response["statusCode"] == 200
+    assert response["headers"]["Content-Type"] == "image/png"
+
+
+def test_utf8_response_is_plain_text():
+    app = _make_app("{\"greeting\": \"héllo\"}".encode("utf-8"), "application/json")
+
+    response = spindrift.wsgi.handler(app, _make_event(), None)
+
+    assert response["isBase64Encoded"] is False
+    assert response["body"] == "{\"greeting\": \"héllo\"}"